@@ -1,69 +1,276 @@
 """Test the SCCNN layer."""
 
+import copy
+import io
+
 import torch
 
 from topomodelx.nn.simplicial.sccnn_layer import SCCNNLayer
 
 
+def _random_complex(channels, n_nodes, n_edges, n_faces, density=0.5):
+    """Return random features, laplacians and incidences of an SC."""
+    x_all = (torch.randn(n_nodes, channels),
+             torch.randn(n_edges, channels),
+             torch.randn(n_faces, channels))
+    laplacian_all = tuple((torch.rand(n, n) < density).float()
+                          for n in (n_nodes, n_edges, n_edges, n_faces))
+    incidence_all = (torch.randint(0, 2, (n_nodes, n_edges)).float(),
+                     torch.randint(0, 2, (n_edges, n_faces)).float())
+    return x_all, laplacian_all, incidence_all
+
+
+def _sccnn(in_channels, out_channels, conv_order=2, aggr_norm=True,
+           **kwargs):
+    """Return an SCCNN layer of order two with the same channels per rank."""
+    return SCCNNLayer(in_channels=(in_channels,) * 3,
+                      out_channels=(out_channels,) * 3,
+                      conv_order=conv_order,
+                      sc_order=2,
+                      aggr_norm=aggr_norm,
+                      **kwargs)
+
+
 class TestSCCNNLayer:
     """Test the SCCNN layer."""
 
     def test_forward(self):
         """Test the forward pass of the SCCNN layer."""
+        # above the size up to which dense operators are kept dense, so that
+        # the CSR products are run
         channels = 5
-        n_nodes = 10
-        n_edges = 30
-        n_faces = 20
-        incidence_1 = torch.randint(0, 2, (n_nodes, n_edges)).float()
-        incidence_2 = torch.randint(0, 2, (n_edges, n_faces)).float()
-        laplacian_0 = torch.randint(0, 2, (n_nodes, n_nodes)).float()
-        laplacian_down_1 = torch.randint(0, 2, (n_edges, n_edges)).float()
-        laplacian_up_1 = torch.randint(0, 2, (n_edges, n_edges)).float()
-        laplacian_2 = torch.randint(0, 2, (n_faces, n_faces)).float()
-        x_0 = torch.randn(n_nodes, channels)
-        x_1 = torch.randn(n_edges, channels)
-        x_2 = torch.randn(n_faces, channels)
-
-        x_all = (x_0, x_1, x_2)
-        channels_all = (channels, channels, channels)
-        laplacian_all = (laplacian_0, laplacian_down_1, laplacian_up_1, laplacian_2)
-        incidence_all = (incidence_1, incidence_2)
-
-        # Without aggregation norm, without update function 
-        sccnn = SCCNNLayer(in_channels=channels_all,
-                           out_channels=channels_all,
-                           conv_order=2,
-                           sc_order=2,
-                           aggr_norm=False,
-                           update_func=None)
-        output = sccnn.forward(x_all, incidence_all, laplacian_all)
-        y_0, y_1, y_2 = output
-        assert y_0.shape == (n_nodes, channels)
-        assert y_1.shape == (n_nodes, channels)
-        assert y_2.shape == (n_nodes, channels)
-
-        # Without aggregation norm, with update function 
-        sccnn = SCCNNLayer(in_channels=channels_all, 
-                           out_channels=channels_all, 
-                           conv_order=2, 
-                           sc_order=2, 
-                           aggr_norm=False, 
-                           update_func='sigmoid')
-        output = sccnn.forward(x_all, incidence_all, laplacian_all)
-        y_0, y_1, y_2 = output
-        assert y_0.shape == (n_nodes, channels)
-        assert y_1.shape == (n_nodes, channels)
-        assert y_2.shape == (n_nodes, channels)
-
-        # With aggregation norm, with update function 
-        sccnn = SCCNNLayer(in_channels=channels_all, 
-                           out_channels=channels_all, 
-                           conv_order=2, 
-                           sc_order=2, 
-                           aggr_norm=True, 
-                           update_func='sigmoid')
-        output = sccnn.forward(x_all, incidence_all, laplacian_all)
-        y_0, y_1, y_2 = output
-        assert y_0.shape == (n_nodes, channels)
-        assert y_1.shape == (n_nodes, channels)
-        assert y_2.shape == (n_nodes, channels)
+        n_nodes = 70
+        n_edges = 90
+        n_faces = 80
+        x_all, laplacian_all, incidence_all = _random_complex(
+            channels, n_nodes, n_edges, n_faces)
+
+        for aggr_norm, update_func in ((False, None),
+                                       (False, 'sigmoid'),
+                                       (True, 'sigmoid')):
+            sccnn = _sccnn(channels, channels, aggr_norm=aggr_norm,
+                           update_func=update_func)
+            output = sccnn.forward(x_all, laplacian_all, incidence_all)
+            y_0, y_1, y_2 = output
+            assert y_0.shape == (n_nodes, channels)
+            assert y_1.shape == (n_edges, channels)
+            assert y_2.shape == (n_faces, channels)
+
+    def test_sparse_operators(self):
+        """Test that dense, COO and CSR operators give the same output."""
+        # small enough for the dense operators to be kept dense
+        x_all, laplacian_all, incidence_all = _random_complex(5, 10, 30, 20)
+        sccnn = _sccnn(5, 5)
+        expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+
+        for to_sparse in (torch.Tensor.to_sparse_coo, torch.Tensor.to_sparse_csr):
+            output = sccnn.forward(
+                x_all,
+                tuple(to_sparse(laplacian) for laplacian in laplacian_all),
+                tuple(to_sparse(incidence) for incidence in incidence_all))
+            for y, y_expected in zip(output, expected):
+                assert torch.allclose(y, y_expected, atol=1e-5)
+
+    def test_chebyshev_conv_weighted(self):
+        """Test that applying the weights first matches the stacked form."""
+        n_simplices = 15
+        in_channels = 8
+        out_channels = 3
+        conv_order = 3
+        laplacian = torch.randint(0, 2, (n_simplices, n_simplices)).float()
+        laplacian = laplacian.to_sparse_csr()
+        x = torch.randn(n_simplices, in_channels)
+        weight = torch.randn(conv_order, in_channels, out_channels)
+
+        for aggr_norm in (False, True):
+            sccnn = _sccnn(in_channels, out_channels, conv_order=conv_order,
+                           aggr_norm=aggr_norm)
+            neighborhood_size = torch.sum(laplacian.to_dense(), dim=1)
+            neighborhood_size_inv = torch.nan_to_num(
+                1 / neighborhood_size, posinf=0.0)
+            expected = torch.einsum(
+                'nik,kio->no',
+                sccnn.chebyshev_conv(laplacian, conv_order, x,
+                                     neighborhood_size_inv),
+                weight)
+            y = sccnn.chebyshev_conv_weighted(laplacian, x, weight,
+                                              neighborhood_size_inv)
+            assert torch.allclose(y, expected, atol=1e-4)
+            # the inverse neighborhood sizes default to those of laplacian
+            assert torch.allclose(
+                sccnn.chebyshev_conv(laplacian, conv_order, x),
+                sccnn.chebyshev_conv(laplacian, conv_order, x,
+                                     neighborhood_size_inv), atol=1e-5)
+            assert torch.allclose(
+                sccnn.chebyshev_conv_weighted(laplacian, x, weight), expected,
+                atol=1e-4)
+
+    def test_operator_cache(self):
+        """Test that cached operators are refreshed after in-place changes."""
+        x_all, laplacian_all, incidence_all = _random_complex(4, 70, 80, 66)
+        sccnn = _sccnn(4, 4)
+        sccnn.forward(x_all, laplacian_all, incidence_all)
+        sccnn.forward(x_all, laplacian_all, incidence_all)
+        assert len(sccnn._operator_cache) == 6
+
+        laplacian_all[0].mul_(2)
+        incidence_all[0].mul_(2)
+        output = sccnn.forward(x_all, laplacian_all, incidence_all)
+        expected = sccnn.forward(
+            x_all,
+            tuple(laplacian.clone() for laplacian in laplacian_all),
+            tuple(incidence.clone() for incidence in incidence_all))
+        for y, y_expected in zip(output, expected):
+            assert torch.allclose(y, y_expected, atol=1e-5)
+
+    def test_copy(self):
+        """Test that layers are copied and saved without their cache."""
+        x_all, laplacian_all, incidence_all = _random_complex(4, 70, 80, 66)
+        sccnn = _sccnn(4, 4)
+        expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+
+        buffer = io.BytesIO()
+        torch.save(sccnn, buffer)
+        buffer.seek(0)
+        for layer in (copy.deepcopy(sccnn),
+                      torch.load(buffer, weights_only=False)):
+            assert len(layer._operator_cache) == 0
+            output = layer.forward(x_all, laplacian_all, incidence_all)
+            for y, y_expected in zip(output, expected):
+                assert torch.allclose(y, y_expected, atol=1e-5)
+        assert len(sccnn._operator_cache) == 6
+
+    def test_load_version_1(self):
+        """Test loading state dicts of the [in, out, order] weight layout."""
+        x_all, laplacian_all, incidence_all = _random_complex(4, 70, 80, 66)
+        sccnn = _sccnn(4, 6)
+        expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+
+        state = sccnn.state_dict()
+        for name in ("weight_0", "weight_1", "weight_2"):
+            state[name] = state[name].permute(1, 2, 0)
+        state._metadata[""]["version"] = 1
+        # also without versions, as in plain dicts, in both layouts
+        for state_dict in (state, dict(state), dict(sccnn.state_dict())):
+            sccnn_loaded = _sccnn(4, 6)
+            sccnn_loaded.load_state_dict(state_dict)
+            output = sccnn_loaded.forward(x_all, laplacian_all, incidence_all)
+            for y, y_expected in zip(output, expected):
+                assert torch.allclose(y, y_expected, atol=1e-5)
+
+    def test_amp_dtype(self):
+        """Test the forward pass with bfloat16 propagations."""
+        # both the stacked and the weights-first paths, on CSR operators
+        for in_channels, out_channels in ((3, 5), (5, 3)):
+            x_all, laplacian_all, incidence_all = _random_complex(
+                in_channels, 70, 80, 66)
+            sccnn = _sccnn(in_channels, out_channels)
+            expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+
+            sccnn_amp = _sccnn(in_channels, out_channels,
+                               amp_dtype=torch.bfloat16)
+            sccnn_amp.load_state_dict(sccnn.state_dict())
+            output = sccnn_amp.forward(x_all, laplacian_all, incidence_all)
+            for y, y_expected in zip(output, expected):
+                assert y.dtype == torch.bfloat16
+                scale = y_expected.abs().max()
+                assert torch.allclose(y.float() / scale, y_expected / scale,
+                                      atol=5e-2)
+
+    def test_empty_operators(self):
+        """Test operators without entries, dense, converted or CSR."""
+        for n_faces, to_sparse in ((3, None), (66, None),
+                                   (66, torch.Tensor.to_sparse_csr)):
+            x_all, laplacian_all, incidence_all = _random_complex(
+                4, 70, 80, n_faces)
+            laplacian_2 = torch.zeros(n_faces, n_faces)
+            incidence_2 = torch.zeros(80, n_faces)
+            if to_sparse is not None:
+                laplacian_2 = to_sparse(laplacian_2)
+                incidence_2 = to_sparse(incidence_2)
+            laplacian_all = laplacian_all[:3] + (laplacian_2,)
+            incidence_all = (incidence_all[0], incidence_2)
+
+            sccnn = _sccnn(4, 4)
+            _, _, y_2 = sccnn.forward(x_all, laplacian_all, incidence_all)
+            # only the identity term of x_2 is left on the faces
+            assert torch.allclose(y_2, x_all[2] @ sccnn.weight_2[0],
+                                  atol=1e-5)
+
+    def test_weights_first(self):
+        """Test the merged weights-first convolutions against the stacked."""
+        x_all, laplacian_all, incidence_all = _random_complex(6, 70, 80, 66)
+        sccnn = _sccnn(6, 2, conv_order=3)
+        sccnn_stacked = _sccnn(6, 2, conv_order=3, weights_first=False)
+        sccnn_stacked.load_state_dict(sccnn.state_dict())
+        output = sccnn.forward(x_all, laplacian_all, incidence_all)
+        expected = sccnn_stacked.forward(x_all, laplacian_all, incidence_all)
+        for y, y_expected in zip(output, expected):
+            assert torch.allclose(y, y_expected, atol=1e-4)
+
+    def test_blocksize(self):
+        """Test BSR laplacians against the CSR ones."""
+        # dense enough for the blocks to be kept
+        x_all, laplacian_all, incidence_all = _random_complex(
+            4, 70, 80, 66, density=0.9)
+        laplacian_all = tuple(laplacian.to_sparse_csr()
+                              for laplacian in laplacian_all)
+
+        sccnn = _sccnn(4, 4)
+        sccnn_bsr = _sccnn(4, 4, blocksize=2)
+        sccnn_bsr.load_state_dict(sccnn.state_dict())
+        with torch.no_grad():
+            expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+            output = sccnn_bsr.forward(x_all, laplacian_all, incidence_all)
+        assert sccnn_bsr.cached_operator(
+            laplacian_all[0], kind="laplacian_bsr")[0].layout == \
+            torch.sparse_bsr
+        for y, y_expected in zip(output, expected):
+            assert torch.allclose(y, y_expected, atol=1e-4)
+
+    def test_blocksize_amp_dtype(self):
+        """Test that half precision laplacians are kept in CSR on CPU."""
+        x_all, laplacian_all, incidence_all = _random_complex(
+            4, 70, 80, 66, density=0.9)
+        sccnn = _sccnn(4, 4, blocksize=2, amp_dtype=torch.bfloat16)
+        with torch.no_grad():
+            output = sccnn.forward(x_all, laplacian_all, incidence_all)
+        assert all(y.dtype == torch.bfloat16 for y in output)
+        assert sccnn.cached_operator(
+            laplacian_all[0], kind="laplacian_bsr")[0].layout == \
+            torch.sparse_csr
+
+    def test_blocksize_backward(self):
+        """Test that layers with a blocksize can be trained."""
+        x_all, laplacian_all, incidence_all = _random_complex(
+            4, 70, 80, 66, density=0.9)
+        laplacian_all = tuple(laplacian.to_sparse_csr()
+                              for laplacian in laplacian_all)
+        # both the stacked and the weights-first paths
+        for out_channels in (6, 2):
+            x_all = tuple(x.clone().requires_grad_() for x in x_all)
+            sccnn = _sccnn(4, out_channels)
+            sccnn_bsr = _sccnn(4, out_channels, blocksize=2)
+            sccnn_bsr.load_state_dict(sccnn.state_dict())
+            for layer in (sccnn, sccnn_bsr):
+                output = layer.forward(x_all, laplacian_all, incidence_all)
+                sum(y.sum() for y in output).backward()
+            for weight, weight_bsr in zip(sccnn.parameters(),
+                                          sccnn_bsr.parameters()):
+                assert torch.allclose(weight.grad, weight_bsr.grad,
+                                      rtol=1e-4, atol=1e-3)
+
+    def test_compile_forward(self):
+        """Test the compiled contractions against the eager ones."""
+        x_all, laplacian_all, incidence_all = _random_complex(4, 70, 80, 66)
+        sccnn = _sccnn(4, 4)
+        sccnn_compiled = _sccnn(4, 4, compile_forward=True)
+        sccnn_compiled.load_state_dict(sccnn.state_dict())
+        expected = sccnn.forward(x_all, laplacian_all, incidence_all)
+        output = sccnn_compiled.forward(x_all, laplacian_all, incidence_all)
+        for y, y_expected in zip(output, expected):
+            assert torch.allclose(y, y_expected, atol=1e-4)
+        sum(y.sum() for y in output).backward()
+        assert sccnn_compiled.weight_1.grad is not None
+        # the compiled function is not part of the layer
+        torch.save(sccnn_compiled, io.BytesIO())
@@ -1,6 +1,283 @@
+import atexit
+import functools
+import time
+from typing import List, Optional
+
 import torch
 from torch.nn.parameter import Parameter
 
+# number of converted operators kept by SCCNNLayer across forward calls
+_OPERATOR_CACHE_SIZE = 32
+
+# dense operators up to this size are kept dense: on such small matrices the
+# dispatch overhead of the sparse kernels outweighs the saved flops
+_DENSE_OPERATOR_SIZE = 64
+
+# minimal fraction of stored block entries that are nonzero for an operator
+# to be kept in BSR layout, below it the padding costs more than it saves
+_BSR_MIN_FILL = 0.5
+
+
+def _to_csr(matrix):
+    r"""Return `matrix` in sparse CSR layout.
+
+    Dense and COO inputs are converted, CSR inputs are returned as is.
+    """
+    if matrix.layout == torch.sparse_csr:
+        return matrix
+    return matrix.to_sparse_csr()
+
+
+def _to_operator(matrix):
+    r"""Return `matrix` in the layout used for propagation.
+
+    Small dense matrices are kept dense, anything else is converted to CSR.
+    All-zero dense matrices are converted too, so that _is_empty detects
+    them from the stored entries, without inspecting every product.
+    """
+    if (matrix.layout == torch.strided
+            and max(matrix.shape) <= _DENSE_OPERATOR_SIZE and matrix.any()):
+        return matrix
+    return _to_csr(matrix)
+
+
+def _to_bsr(conv_operator, blocksize):
+    r"""Return a CSR operator in BSR layout with square blocks.
+
+    The operator is returned unchanged if its shape is not a multiple of
+    blocksize, if its blocks would be mostly padding, or if its dtype has
+    no BSR product on its device: on CPU, only float32 and float64 do.
+    """
+    if conv_operator.device.type == "cpu" and \
+            conv_operator.dtype not in (torch.float32, torch.float64):
+        return conv_operator
+    n_rows, n_cols = conv_operator.shape
+    if n_rows % blocksize or n_cols % blocksize:
+        return conv_operator
+    bsr = conv_operator.to_sparse_bsr((blocksize, blocksize))
+    n_stored = bsr.values().numel()
+    if n_stored == 0 or conv_operator.values().numel() < _BSR_MIN_FILL * n_stored:
+        return conv_operator
+    return bsr
+
+
+@torch.jit.script
+def _is_empty(matrix):
+    r"""Check whether an operator has no nonzero entries.
+
+    E.g., the laplacian of a complex without triangles. Only the stored
+    entries are checked, all-zero dense operators are converted to CSR by
+    _to_operator.
+    """
+    if matrix.layout == torch.strided:
+        return matrix.numel() == 0
+    return matrix.values().numel() == 0
+
+
+@torch.jit.script
+def _spmm(sparse, dense):
+    r"""Multiply an operator with a dense matrix.
+
+    The operator is CSR, BSR or small and dense. On CPU, CSR operators
+    dispatch to the fused CSR kernel of `torch.sparse.mm(..., reduce="sum")`;
+    the reduction is not implemented on other devices, which use the generic
+    sparse product instead. On CPU, the columns of dense are zero-padded to
+    a multiple of 16 for BSR operators. Empty operators short-circuit to
+    zeros.
+    """
+    if _is_empty(sparse):
+        return torch.zeros([sparse.shape[0], dense.shape[1]],
+                           dtype=dense.dtype, device=dense.device)
+    if sparse.layout == torch.strided:
+        return torch.mm(sparse, dense)
+    if sparse.layout == torch.sparse_csr and dense.device.type == "cpu":
+        return torch.sparse.mm(sparse, dense, "sum")
+    if sparse.layout == torch.sparse_bsr and dense.device.type == "cpu":
+        # the MKL kernel is only fast on a multiple of 16 columns, e.g., on
+        # 4x4 blocks of a 5000-row operator, 0.5ms for 8 columns padded to
+        # 16, against 22ms unpadded and 2ms for the CSR product
+        n_cols = dense.shape[1]
+        n_pad = (16 - n_cols % 16) % 16
+        if n_pad:
+            dense = torch.nn.functional.pad(dense, [0, n_pad])
+            return torch.sparse.mm(sparse, dense)[:, :n_cols]
+    return torch.sparse.mm(sparse, dense)
+
+
+@torch.jit.script
+def _aggr_norm(neighborhood_size_inv, x):
+    r"""Scale the rows of x by the inverse neighborhood sizes."""
+    return x * neighborhood_size_inv.unsqueeze(1)
+
+
+@torch.jit.script
+def _propagate(conv_operator, x, neighborhood_size_inv: Optional[torch.Tensor]):
+    r"""Compute one step conv_operator @ x of the Chebyshev recursion.
+
+    The result is normalized when the inverse neighborhood sizes are given.
+    """
+    x = _spmm(conv_operator, x)
+    if neighborhood_size_inv is not None:
+        x = _aggr_norm(neighborhood_size_inv, x)
+    return x
+
+
+@torch.jit.script
+def _chebyshev_conv(conv_operator, conv_order: int, x,
+                    neighborhood_size_inv: Optional[torch.Tensor]):
+    r"""Scripted body of SCCNNLayer.chebyshev_conv."""
+    if _is_empty(conv_operator):
+        return torch.zeros([x.shape[0], x.shape[1], conv_order],
+                           dtype=x.dtype, device=x.device)
+    X: List[torch.Tensor] = []
+    x_k = x
+    for _ in range(conv_order):
+        x_k = _propagate(conv_operator, x_k, neighborhood_size_inv)
+        X.append(x_k)
+    return torch.stack(X, dim=2)
+
+
+@torch.jit.script
+def _chebyshev_conv_weighted(conv_operator, x, weight,
+                             neighborhood_size_inv: Optional[torch.Tensor]):
+    r"""Scripted body of SCCNNLayer.chebyshev_conv_weighted."""
+    if _is_empty(conv_operator):
+        return torch.zeros([x.shape[0], weight.shape[2]],
+                           dtype=x.dtype, device=x.device)
+    conv_order = weight.shape[0]
+    y = torch.mm(x, weight[conv_order-1])
+    for k in range(conv_order-2, -1, -1):
+        y = _propagate(conv_operator, y, neighborhood_size_inv)
+        y = y + torch.mm(x, weight[k])
+    return _propagate(conv_operator, y, neighborhood_size_inv)
+
+
+@torch.jit.script
+def _fork_chebyshev_convs(conv_operators: List[torch.Tensor],
+                          xs: List[torch.Tensor],
+                          weights: List[Optional[torch.Tensor]],
+                          neighborhood_size_invs: List[Optional[torch.Tensor]],
+                          conv_order: int):
+    r"""Run independent Chebyshev convolutions concurrently.
+
+    Each convolution is forked, weighted when its weight is given, and all
+    are waited on. Forking only runs tasks in parallel from TorchScript,
+    eager calls to torch.jit.fork are executed synchronously.
+    """
+    futures: List[torch.jit.Future[torch.Tensor]] = []
+    for i in range(len(xs)):
+        weight = weights[i]
+        if weight is None:
+            futures.append(torch.jit.fork(
+                _chebyshev_conv, conv_operators[i], conv_order, xs[i],
+                neighborhood_size_invs[i]))
+        else:
+            futures.append(torch.jit.fork(
+                _chebyshev_conv_weighted, conv_operators[i], xs[i], weight,
+                neighborhood_size_invs[i]))
+    return [torch.jit.wait(future) for future in futures]
+
+
+def _contract(x_all, weight):
+    r"""Contract sum_k x_all[k] @ weight[k] as one batched GEMM."""
+    return torch.bmm(x_all, weight).sum(dim=0)
+
+
+def _contract_weights_first(xs: List[torch.Tensor], weight, orders: List[int],
+                            terms: List[torch.Tensor]):
+    r"""Sum xs[i] @ weight[orders[i]] and the already weighted terms."""
+    y = torch.mm(xs[0], weight[orders[0]])
+    for i in range(1, len(xs)):
+        y = y + torch.mm(xs[i], weight[orders[i]])
+    for term in terms:
+        y = y + term
+    return y
+
+
+def _block_conv(xs: List[torch.Tensor], n_operators: List[int], weight,
+                convs: List[List[torch.Tensor]], conv_order: int,
+                weights_first: bool):
+    r"""Body of SCCNNLayer.block_conv, see there."""
+    weight = weight.to(xs[0].dtype)
+    if weights_first:
+        orders: List[int] = []
+        terms: List[torch.Tensor] = []
+        k = 0
+        for i in range(len(xs)):
+            orders.append(k)
+            terms.extend(convs[i])
+            k += 1 + n_operators[i] * conv_order
+        return _contract_weights_first(xs, weight, orders, terms)
+
+    # write every term into its slice of a single buffer rather than
+    # concatenating, which would copy the earlier terms again
+    x_all = torch.empty([weight.shape[0], xs[0].shape[0], weight.shape[1]],
+                        dtype=xs[0].dtype, device=xs[0].device)
+    k = 0
+    for i in range(len(xs)):
+        x_all[k] = xs[i]
+        k += 1
+        for conv in convs[i]:
+            x_all[k:k+conv_order] = conv.permute(2, 0, 1)
+            k += conv_order
+    return _contract(x_all, weight)
+
+
+@torch.jit.script
+def _fork_block_convs(xs_all: List[List[torch.Tensor]],
+                      n_operators_all: List[List[int]],
+                      weights: List[torch.Tensor],
+                      convs_all: List[List[List[torch.Tensor]]],
+                      conv_order: int, weights_first: List[bool]):
+    r"""Run the contractions of several outputs concurrently.
+
+    The scripted counterpart of _fork_chebyshev_convs for _block_conv, the
+    contractions run in the dtype of the features.
+    """
+    futures: List[torch.jit.Future[torch.Tensor]] = []
+    for i in range(len(xs_all)):
+        futures.append(torch.jit.fork(
+            _block_conv, xs_all[i], n_operators_all[i], weights[i],
+            convs_all[i], conv_order, weights_first[i]))
+    return [torch.jit.wait(future) for future in futures]
+
+
+@functools.lru_cache(maxsize=None)
+def _register_fork_exit():
+    r"""Delay the interpreter exit once tasks have been forked.
+
+    The inter-op threads are still finishing a forked task for a short while
+    after it was waited on, and if the interpreter shuts down meanwhile, the
+    process aborts with "terminate called without an active exception"
+    (seen with PyTorch 2.14 in one run out of two for scripts ending with a
+    forward call). Sleeping 10ms at exit, once per process, lets them finish.
+    """
+    atexit.register(time.sleep, 0.01)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_block_conv():
+    r"""Return _block_conv through torch.compile, built on first use.
+
+    Compiling the module-level function rather than a bound method keeps
+    the layers free of compiled state, so that they can still be pickled.
+    """
+    return torch.compile(_block_conv, dynamic=False)
+
+
+def _neighborhood_size_inv(conv_operator):
+    r"""Compute the inverse row sums of an operator.
+
+    The result is a dense vector of shape [n_rows], zero for empty rows,
+    computed once per operator, so that the normalization of every
+    Chebyshev step is a plain broadcast multiply.
+    """
+    ones = torch.ones(conv_operator.shape[1], 1,
+                      dtype=conv_operator.dtype, device=conv_operator.device)
+    neighborhood_size = _spmm(conv_operator, ones).squeeze(1)
+    return torch.where(neighborhood_size != 0, neighborhood_size.reciprocal(),
+                       torch.zeros_like(neighborhood_size))
+
 
 class SCCNNLayer(torch.nn.Module):
 
@@ -17,6 +294,38 @@ class SCCNNLayer(torch.nn.Module):
     conv_order: int
         convolution order of the simplicial filters
         to avoid too many parameters, we consider them to be the same 
+    compile_forward: bool
+        whether to run the dense contractions of forward, block_conv,
+        through torch.compile, default False; the sparse propagations are
+        left out, as they cannot be traced. Compilation happens on the
+        first call, specializes on the shapes of a fixed topology and uses
+        the default mode, the CUDA graphs of "reduce-overhead" having no
+        effect on CPU. The compiled contractions of the three outputs run
+        one after the other, whereas without compile_forward they are
+        forked concurrently from TorchScript
+    amp_dtype: torch.dtype, optional
+        e.g., torch.bfloat16 or torch.float16; when given, the features,
+        operators and weights are cast to this dtype, so that the sparse
+        propagations and the contractions run in it, which halves the memory
+        traffic of the bandwidth-bound products; the outputs are returned in
+        this dtype
+    weights_first: bool, optional
+        whether to multiply by the weights before propagating, see
+        chebyshev_conv_weighted; by default, when in_channels is larger
+        than out_channels, which runs the sparse products on the narrower
+        columns
+    blocksize: int, optional
+        when given, sparse laplacians are stored in BSR layout with square
+        blocks of this size, which amortizes the indexing over each block;
+        operators whose shape is not a multiple of it, or whose blocks are
+        mostly zero, are kept in CSR layout, as are those in half precision
+        on CPU, where PyTorch has no such BSR product. As backward through a
+        BSR product needs the transposed, BSC product, which PyTorch does not
+        implement on CPU, the BSR operators are only used when no gradient
+        is required, e.g., for inference under torch.no_grad(). On CPU, the
+        BSR product is only faster than the CSR one on operators made of
+        dense blocks, e.g., 2 to 4 times on 4x4 blocks of 2000 to 5000 rows;
+        on scattered entries, prefer the default CSR layout
 
     Example
     -------
@@ -41,40 +350,48 @@ class SCCNNLayer(torch.nn.Module):
     
     SCCNN layer looks like:
         
-        Y_0 = torch.einsum(
+        Y_0 = torch.einsum('nik,kio->no',
         concat(
             X_0, L_0@X_0, L_0@L_0@X_0 || 
             B_1@X_1, B_1@L_1_down@X_1, B_1@L_1_down@L_1_down@X_1
         ), weight_0)
-        Y_1 = torch.einsum(
+        Y_1 = torch.einsum('nik,kio->no',
         concat(
             B_1.T@X_1, B_1.T@L_0@X_0, B_1.T@L_0@L_0@X_0 ||
             X_1, L_1_down@X_1, L_1_down@L_1_down@X_1, 
                 L_1_up@X_1, L_1_up@L_1_up@X_1 ||
             B_2@X_2, B_2@L_2@X_2, B_2@L_2@L_2@X_2
         ), weight_1)
-        Y_2 = torch.einsum(
+        Y_2 = torch.einsum('nik,kio->no',
         concat(
             X_2, L_2@X_2, L_2@L_2@X_2 ||
             B_2.T@X_1, B_2.T@L_1_up@X_1, B_2.T@L_1_up@L_1_up@X_1
         ), weight_2)
     where
         - weight_0, weight_2, weight_2 are the trainable parameters 
-        - weight_0: [out_channels, in_channels, total_order_0]
+        - weight_0: [total_order_0, in_channels, out_channels]
             - total_order_0 = 1+conv_order + 1+conv_order
-        - weight_1: [out_channels, in_channels, total_order_1]
+        - weight_1: [total_order_1, in_channels, out_channels]
             - total_order_1 = 1+conv_order + 
                               1+conv_order+conv_order + 
                               1+conv_order
-        - weight_2: [out_channels, in_channels, total_order_2]
+        - weight_2: [total_order_2, in_channels, out_channels]
             - total_order_2 = 1+conv_order + 1+conv_order 
         - to implement Lap_down@Lap_down@X, we consider chebyshev method 
             to avoid matrix@matrix computation
+        - the order axis leads in the weights and in the stacked features,
+            so that the contraction is one batched GEMM over it
 
     """
+    # version 1 state dicts, from before the order axis led in the weights,
+    # are permuted on loading, see _load_from_state_dict
+    _version = 2
+
     def __init__(self, in_channels, out_channels, conv_order, sc_order,
                  aggr_norm=False, update_func=None,
-                 initialization="xavier_normal"):
+                 initialization="xavier_normal", compile_forward=False,
+                 amp_dtype=None, weights_first=None,
+                 blocksize=None):
         super().__init__()
 
         in_channels_0, in_channels_1, in_channels_2 = in_channels
@@ -93,32 +410,39 @@ class SCCNNLayer(torch.nn.Module):
         self.aggr_norm = aggr_norm
         self.update_func = update_func
         self.initialization = initialization
+        self.compile_forward = compile_forward
+        self.amp_dtype = amp_dtype
+        self.weights_first = weights_first
+        self.blocksize = blocksize
 
         assert initialization in ["xavier_uniform", "xavier_normal"]
         assert self.conv_order > 0
 
         self.weight_0 = Parameter(
-            torch.Tensor(self.in_channels_0, self.out_channels_0,
-                         1+conv_order + 1+conv_order))
+            torch.Tensor(1+conv_order + 1+conv_order,
+                         self.in_channels_0, self.out_channels_0))
 
         self.weight_1 = Parameter(
-            torch.Tensor(self.in_channels_1, self.out_channels_1,
-                         1+conv_order +
+            torch.Tensor(1+conv_order +
                          1+conv_order+conv_order +
-                         1+conv_order))
+                         1+conv_order,
+                         self.in_channels_1, self.out_channels_1))
         
-        # determine the third dimensions of the weights
+        # determine the first dimensions of the weights
         # because when SC order is larger than 2, there are lower and upper 
         # parts for L_2; otherwise, L_2 contains only the lower part 
         if sc_order > 2:
             self.weight_2 = Parameter(
-                torch.Tensor(self.in_channels_2, self.out_channels_2,
-                             1+conv_order + 1+conv_order+conv_order))
+                torch.Tensor(1+conv_order + 1+conv_order+conv_order,
+                             self.in_channels_2, self.out_channels_2))
         elif sc_order == 2:
             self.weight_2 = Parameter(
-                torch.Tensor(self.in_channels_2, self.out_channels_2,
-                             1+conv_order + 1+conv_order))
-        
+                torch.Tensor(1+conv_order + 1+conv_order,
+                             self.in_channels_2, self.out_channels_2))
+
+        # converted operators seen by forward, see cached_operator
+        self._operator_cache = {}
+
         self.reset_parameters()
 
     def reset_parameters(self, gain=1.414):
@@ -134,30 +458,116 @@ class SCCNNLayer(torch.nn.Module):
         gain : float
             Gain for the weight initialization.
         """
+        # initialize through [in_channels, out_channels, total_order] views,
+        # so that the fans do not depend on the storage order of the weights
+        weight_0 = self.weight_0.permute(1, 2, 0)
+        weight_1 = self.weight_1.permute(1, 2, 0)
+        weight_2 = self.weight_2.permute(1, 2, 0)
         if self.initialization == "xavier_uniform":
-            torch.nn.init.xavier_uniform_(self.weight_0, gain=gain)
-            torch.nn.init.xavier_uniform_(self.weight_1, gain=gain)
-            torch.nn.init.xavier_uniform_(self.weight_2, gain=gain)
+            torch.nn.init.xavier_uniform_(weight_0, gain=gain)
+            torch.nn.init.xavier_uniform_(weight_1, gain=gain)
+            torch.nn.init.xavier_uniform_(weight_2, gain=gain)
         elif self.initialization == "xavier_normal":
-            torch.nn.init.xavier_normal_(self.weight_0, gain=gain)
-            torch.nn.init.xavier_normal_(self.weight_1, gain=gain)
-            torch.nn.init.xavier_normal_(self.weight_2, gain=gain)
+            torch.nn.init.xavier_normal_(weight_0, gain=gain)
+            torch.nn.init.xavier_normal_(weight_1, gain=gain)
+            torch.nn.init.xavier_normal_(weight_2, gain=gain)
         else:
             raise RuntimeError(
                 "Initialization method not recognized. "
                 "Should be either xavier_uniform or xavier_normal."
             )
         
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata,
+                              strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        r"""Load a state dict, converting weights of the version 1 layout.
+
+        Version 1 weights are [in_channels, out_channels, total_order]. State
+        dicts without version, e.g., copied into a plain dict, are only
+        converted when the weights do not already have the current shape.
+        """
+        version = local_metadata.get("version")
+        if version is None or version < 2:
+            for name in ("weight_0", "weight_1", "weight_2"):
+                key = prefix + name
+                weight = state_dict.get(key)
+                if weight is None or weight.dim() != 3:
+                    continue
+                if version is not None or \
+                        weight.shape != getattr(self, name).shape:
+                    state_dict[key] = weight.permute(2, 0, 1)
+        super()._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys,
+            unexpected_keys, error_msgs)
+
+    def __getstate__(self):
+        r"""Return the state to copy or pickle, without the operator cache.
+
+        The cached operators are derived from the inputs, CSR tensors
+        cannot be deep-copied, and the cache is rebuilt on the next call.
+        """
+        state = self.__dict__.copy()
+        state["_operator_cache"] = {}
+        return state
+
+    def cached_operator(self, matrix, kind="laplacian"):
+        r"""Return the prepared form of an operator, cached across calls.
+
+        With a fixed topology the same laplacians and incidences are passed
+        to every forward call, so their conversion (and neighborhood
+        sizes) is computed once. Entries are keyed on the identity of
+        matrix and refreshed if it is modified in place.
+
+        Parameters
+        ----------
+        matrix: torch.Tensor, dense or sparse
+        kind: str
+        "laplacian" returns (conv_operator, neighborhood_size_inv), with the
+        inverse neighborhood sizes None unless aggr_norm is True;
+        "laplacian_bsr" the same with conv_operator in BSR layout when
+        blocksize allows it;
+        "incidence" returns (incidence, incidence_t), the converted matrix
+        and its transpose
+        """
+        key = (kind, id(matrix))
+        entry = self._operator_cache.get(key)
+        if entry is None or entry[1] != matrix._version:
+            if len(self._operator_cache) >= _OPERATOR_CACHE_SIZE:
+                self._operator_cache.clear()
+            operator = _to_operator(matrix)
+            if self.amp_dtype is not None:
+                operator = operator.to(dtype=self.amp_dtype)
+            if kind == "incidence":
+                operator_t = _to_operator(matrix.t())
+                if self.amp_dtype is not None:
+                    operator_t = operator_t.to(dtype=self.amp_dtype)
+                operator = (operator, operator_t)
+            if kind in ("laplacian", "laplacian_bsr"):
+                neighborhood_size_inv = None
+                if self.aggr_norm:
+                    neighborhood_size_inv = _neighborhood_size_inv(operator)
+                if kind == "laplacian_bsr" and \
+                        operator.layout == torch.sparse_csr:
+                    operator = _to_bsr(operator, self.blocksize)
+                operator = (operator, neighborhood_size_inv)
+            # keeping matrix alive guarantees that its id is not reused
+            entry = (matrix, matrix._version, operator)
+            self._operator_cache[key] = entry
+        return entry[2]
+
     def aggr_norm_func(self, conv_operator, x):
         r""" aggregation normalization 
+
+        Parameters
+        ----------
+        conv_operator: torch.Tensor, dense or sparse
+        shape = [n_simplices,n_simplices]
+        x : torch.Tensor, shape = [n_simplices,num_channels]
+
+        forward and the Chebyshev convolutions instead use the inverse
+        neighborhood sizes cached with each operator, see cached_operator
         """
-        neighborhood_size = torch.sum(conv_operator.to_dense(), dim=1)
-        neighborhood_size_inv = 1/neighborhood_size
-        neighborhood_size_inv[~(torch.isfinite(neighborhood_size_inv))] = 0
-        
-        x = torch.einsum("i,ij->ij ", neighborhood_size_inv, x)
-        x[~torch.isfinite(x)] = 0
-        return x 
+        return _aggr_norm(_neighborhood_size_inv(conv_operator), x)
 
     def update(self, x):
         """Update embeddings on each cell (step 4).
@@ -178,37 +588,199 @@ class SCCNNLayer(torch.nn.Module):
         if self.update_func == "relu":
             return torch.nn.functional.relu(x)
         
-    def chebyshev_conv(self, conv_operator, conv_order, x): 
+    def chebyshev_conv(self, conv_operator, conv_order, x,
+                       neighborhood_size_inv=None): 
         r"""A Chebyshev convolution method.
         Parameters
         ----------
-        conv_operator: torch.sparse 
+        conv_operator: torch.sparse, CSR or BSR layout, or a small dense tensor
         shape = [n_simplices,n_simplices]
         e.g., the adjacency matrix, or the Hodge Laplacians
         conv_order: int
         the order of the convolution
         x : torch.Tensor
         shape = [n_simplices,num_channels]
+        neighborhood_size_inv: torch.Tensor, optional
+        shape = [n_simplices], inverse row sums of conv_operator, used when
+        aggr_norm is True; computed from conv_operator if not given
         
         Return
         ------
         x[:, :, k] = (conv_operator@....@conv_operator) @ x 
         """
-        num_simplices, num_channels = x.shape 
-        X = torch.empty(size=(num_simplices, num_channels, conv_order))
-        
-        if self.aggr_norm:
-            X[:, :, 0] = torch.mm(conv_operator, x)
-            X[:, :, 0] = self.aggr_norm_func(conv_operator, X[:, :, 0])
-            for k in range(1, conv_order):
-                X[:, :, k] = torch.mm(conv_operator, X[:, :, k-1])
-                X[:, :, k] = self.aggr_norm_func(conv_operator, X[:, :, k])
-        else:
-            X[:, :, 0] = torch.mm(conv_operator, x)
-            for k in range(1, conv_order):
-                X[:, :, k] = torch.mm(conv_operator, X[:, :, k-1])
-        return X
-            
+        if not self.aggr_norm:
+            neighborhood_size_inv = None
+        elif neighborhood_size_inv is None:
+            neighborhood_size_inv = _neighborhood_size_inv(conv_operator)
+        return _chebyshev_conv(
+            conv_operator, conv_order, x, neighborhood_size_inv)
+
+    def chebyshev_conv_weighted(self, conv_operator, x, weight,
+                                neighborhood_size_inv=None):
+        r"""Apply a Chebyshev convolution with the weights applied first.
+
+        Computes the same as
+        torch.einsum('nik,kio->no', self.chebyshev_conv(
+            conv_operator, conv_order, x, neighborhood_size_inv), weight)
+        but evaluates the sum of powers by Horner's rule,
+            A@(x@W_1 + A@(x@W_2 + ... + A@(x@W_K))),
+        so that every sparse product runs on out_channels columns.
+
+        Parameters
+        ----------
+        conv_operator: torch.sparse, CSR or BSR layout, or a small dense tensor
+        shape = [n_simplices,n_simplices]
+        x : torch.Tensor
+        shape = [n_simplices,in_channels]
+        weight: torch.Tensor
+        shape = [conv_order,in_channels,out_channels]
+        neighborhood_size_inv: torch.Tensor, optional
+        shape = [n_simplices], inverse row sums of conv_operator, see
+        chebyshev_conv
+
+        Return
+        ------
+        y : torch.Tensor, shape = [n_simplices,out_channels]
+        """
+        if not self.aggr_norm:
+            neighborhood_size_inv = None
+        elif neighborhood_size_inv is None:
+            neighborhood_size_inv = _neighborhood_size_inv(conv_operator)
+        return _chebyshev_conv_weighted(
+            conv_operator, x, weight, neighborhood_size_inv)
+
+    def block_chebyshev_conv(self, blocks, weight):
+        r"""Compute the Chebyshev convolutions of the blocks of one output.
+
+        Parameters
+        ----------
+        blocks: tuple of (x, conv_operators)
+        - x: torch.Tensor, shape = [n_simplices,in_channels]
+        - conv_operators: tuple of (conv_operator, neighborhood_size_inv)
+        each block contributes x followed by the conv_order powers of
+        each of its operators applied to x, in the order of the first
+        dimension of weight
+        weight: torch.Tensor
+        shape = [total_order,in_channels,out_channels]
+
+        Return
+        ------
+        convs: list, for each block, of the convolutions of x by its
+        operators, each of shape [n_simplices,in_channels,conv_order]; in
+        weights-first mode, the weighted convolutions of shape
+        [n_simplices,out_channels] instead, where those sharing an operator
+        are summed and listed with the first block using it
+        """
+        chains = self._chebyshev_chains(blocks, weight)
+        return self._gather_chebyshev_convs(
+            blocks, weight, chains, self._run_chebyshev_chains(chains))
+
+    def _chebyshev_chains(self, blocks, weight):
+        r"""Group the Chebyshev convolutions of one output by operator.
+
+        Return a list of (conv_operator, x, weight_chain,
+        neighborhood_size_inv, members), with members the (i, j, x, k) of the
+        blocks i and operators j propagated together, and weight_chain None
+        unless in weights-first mode, see block_chebyshev_conv.
+        """
+        # features propagated by the same operator are column-stacked into
+        # one recursion, which reads the operator once per step for all;
+        # with the weights applied first, stacking x along with the rows of
+        # the weights sums the weighted convolutions of the members
+        grouped = {}
+        k = 0
+        for i, (x, conv_operators) in enumerate(blocks):
+            k += 1
+            for j, operator in enumerate(conv_operators):
+                grouped.setdefault(id(operator), (operator, []))[1].append(
+                    (i, j, x, k))
+                k += self.conv_order
+
+        weights_first = self.use_weights_first(weight)
+        chains = []
+        for (conv_operator, neighborhood_size_inv), members in \
+                grouped.values():
+            if len(members) == 1:
+                x = members[0][2]
+            else:
+                x = torch.cat([x for _, _, x, _ in members], dim=1)
+            weight_chain = None
+            if weights_first:
+                weight_chain = torch.cat(
+                    [weight[k:k+self.conv_order] for _, _, _, k in members],
+                    dim=1).to(x.dtype)
+            chains.append((conv_operator, x, weight_chain,
+                           neighborhood_size_inv, members))
+        return chains
+
+    def _run_chebyshev_chains(self, chains):
+        r"""Compute the convolutions of chains, see _fork_chebyshev_convs."""
+        # every call of the fork drivers, _fork_block_convs too, goes by here
+        _register_fork_exit()
+        return _fork_chebyshev_convs(
+            [chain[0] for chain in chains], [chain[1] for chain in chains],
+            [chain[2] for chain in chains], [chain[3] for chain in chains],
+            self.conv_order)
+
+    def _gather_chebyshev_convs(self, blocks, weight, chains, chain_convs):
+        r"""Split the convolutions of the chains per block.
+
+        See block_chebyshev_conv for the returned layout.
+        """
+        if self.use_weights_first(weight):
+            convs = [[] for _ in blocks]
+            for chain, conv in zip(chains, chain_convs):
+                convs[chain[4][0][0]].append(conv)
+            return convs
+
+        convs = [[None] * len(conv_operators)
+                 for _, conv_operators in blocks]
+        for chain, conv in zip(chains, chain_convs):
+            start = 0
+            for i, j, x, _ in chain[4]:
+                convs[i][j] = conv[:, start:start + x.shape[1]]
+                start += x.shape[1]
+        return convs
+
+    def use_weights_first(self, weight):
+        r"""Check whether to multiply by weight before propagating.
+
+        Unless set by weights_first, this is the case when it runs the
+        sparse products on the narrower out_channels columns.
+        """
+        if self.weights_first is not None:
+            return self.weights_first
+        _, in_channels, out_channels = weight.shape
+        return in_channels > out_channels
+
+    def block_conv(self, xs, n_operators, weight, convs):
+        r"""Contract the blocks of one output with its weights.
+
+        Only dense tensors go in, so that this is the region compiled when
+        compile_forward is True.
+
+        Parameters
+        ----------
+        xs: tuple of torch.Tensor
+        the features x of the blocks, see block_chebyshev_conv
+        n_operators: tuple of int
+        the number of operators of each block
+        weight: torch.Tensor
+        shape = [total_order,in_channels,out_channels]
+        convs: list
+        the Chebyshev convolutions of the blocks, from block_chebyshev_conv
+
+        Return
+        ------
+        y : torch.Tensor, shape = [n_simplices,out_channels]
+        """
+        block_conv = _block_conv
+        if self.compile_forward:
+            block_conv = _compiled_block_conv()
+        return block_conv(list(xs), list(n_operators), weight,
+                          [list(convs_block) for convs_block in convs],
+                          self.conv_order, self.use_weights_first(weight))
+
     def forward(self, x_all, laplacian_all, incidence_all):
         r"""Forward computation. 
         
@@ -225,6 +797,9 @@ class SCCNNLayer(torch.nn.Module):
         - laplacian_down_1: torch.sparse, the 1-Hodge laplacian (lower part)
         - laplacian_up_1: torch.sparse, the 1-hodge laplacian (upper part)
         - laplacian_2: torch.sparse, the 2-hodge laplacian
+        dense, COO and CSR operators are accepted; they are converted to CSR
+        once per topology, see cached_operator, except that small dense
+        operators are kept dense
             
         incidence_all: tuple (b1,b2)
         - b1: torch.sparse, 
@@ -241,82 +816,96 @@ class SCCNNLayer(torch.nn.Module):
         - y_2: output on triangles 
         """
         x_0, x_1, x_2 = x_all  
+        if self.amp_dtype is not None:
+            # autocast does not cover the scripted and sparse products, and
+            # would promote their normalization to float32, cast explicitly
+            x_0, x_1, x_2 = (x.to(self.amp_dtype) for x in x_all)
+
+        # the propagations below are sparse-dense products, so the operators
+        # are converted to CSR rather than multiplied densely, unless small
+        # dense operators are kept dense.
+        # BSR products have no backward on CPU, so BSR laplacians are only
+        # used when no gradient is needed, see blocksize
+        kind = "laplacian"
+        if self.blocksize is not None and not (
+                torch.is_grad_enabled() and any(
+                    tensor.requires_grad
+                    for tensor in (*x_all, *self.parameters()))):
+            kind = "laplacian_bsr"
+        operator_all = tuple(self.cached_operator(laplacian, kind=kind)
+                             for laplacian in laplacian_all)
 
         if self.sc_order == 2:
-            laplacian_0, laplacian_down_1, laplacian_up_1, laplacian_2 = laplacian_all
+            operator_0, operator_down_1, operator_up_1, operator_2 = operator_all
         elif self.sc_order > 2:
-            laplacian_0, laplacian_down_1, laplacian_up_1, \
-                laplacian_down_2, laplacian_up_2 = laplacian_all
-
-        num_nodes, num_edges, num_triangles = x_0.shape[0], x_1.shape[0], x_2.shape[0] 
+            operator_0, operator_down_1, operator_up_1, \
+                operator_down_2, operator_up_2 = operator_all
 
         b1, b2 = incidence_all
+        b1, b1_t = self.cached_operator(b1, kind="incidence")
+        b2, b2_t = self.cached_operator(b2, kind="incidence")
 
-        identity_0, identity_1, identity_2 = torch.eye(num_nodes), \
-            torch.eye(num_edges), torch.eye(num_triangles)
+        x_1_to_0 = _spmm(b1, x_1)
+        x_0_to_1 = _spmm(b1_t, x_0)
+        x_2_to_1 = _spmm(b2, x_2)
+        x_1_to_2 = _spmm(b2_t, x_1)
 
         '''
         convolution in the node space 
         '''
-        x_identity_0 = torch.unsqueeze(identity_0@x_0, 2)
-        x_0_to_0 = self.chebyshev_conv(laplacian_0, self.conv_order, x_0)
-        x_0_to_0 = torch.cat((x_identity_0, x_0_to_0), 2)
-        
-        x_1_to_0 = torch.mm(b1, x_1)
-        x_1_to_0_identity = torch.unsqueeze(identity_0@x_1_to_0, 2)
-        x_1_to_0 = self.chebyshev_conv(laplacian_0, self.conv_order, x_1_to_0)
-        x_1_to_0 = torch.cat((x_1_to_0_identity, x_1_to_0), 2)
-        
-        x_0_all = torch.cat((x_0_to_0, x_1_to_0), 2)
+        blocks_0 = ((x_0, (operator_0,)),
+                    (x_1_to_0, (operator_0,)))
 
         '''
         convolution in the edge space 
         '''
-        x_identity_1 = torch.unsqueeze(identity_1@x_1, 2)
-        x_1_down = self.chebyshev_conv(laplacian_down_1, self.conv_order, x_1)
-        x_1_up = self.chebyshev_conv(laplacian_up_1, self.conv_order, x_1)
-        x_1_to_1 = torch.cat((x_identity_1, x_1_down, x_1_up), 2)
-
-        x_0_to_1 = torch.mm(b1.T, x_0)
-        x_0_to_1_identity = torch.unsqueeze(identity_1@x_0_to_1, 2)
-        x_0_to_1 = self.chebyshev_conv(laplacian_down_1, self.conv_order, x_0_to_1)
-        x_0_to_1 = torch.cat((x_0_to_1_identity, x_0_to_1), 2)
-
-        x_2_to_1 = torch.mm(b2, x_2)
-        x_2_to_1_identity = torch.unsqueeze(identity_1@x_2_to_1, 2)
-        x_2_to_1 = self.chebyshev_conv(laplacian_up_1, self.conv_order, x_2_to_1)
-        x_2_to_1 = torch.cat((x_2_to_1_identity, x_2_to_1), 2)
-
-        x_1_all = torch.cat((x_0_to_1, x_1_to_1, x_2_to_1), 2)
+        blocks_1 = ((x_0_to_1, (operator_down_1,)),
+                    (x_1, (operator_down_1, operator_up_1)),
+                    (x_2_to_1, (operator_up_1,)))
 
         '''
         convolution in the face (triangle) space, depending on the SC order, 
         the exact form maybe a little different 
         '''
-        x_identity_2 = torch.unsqueeze(identity_2@x_2, 2)
-
-        if self.sc_order == 2: 
-            x_2 = self.chebyshev_conv(laplacian_2, self.conv_order, x_2)
-            x_2_to_2 = torch.cat((x_identity_2, x_2), 2)
-        elif self.sc_order > 2:
-            x_2_down = self.chebyshev_conv(laplacian_down_2, self.conv_order, x_2)
-            x_2_up = self.chebyshev_conv(laplacian_up_2, self.conv_order, x_2)
-            x_2_to_2 = torch.cat((x_identity_2, x_2_down, x_2_up), 2)
-
-        x_1_to_2 = torch.mm(b2.T, x_1)
-        x_1_to_2_identity = torch.unsqueeze(identity_2@x_1_to_2, 2)
-        if self.sc_order == 2: 
-            x_1_to_2 = self.chebyshev_conv(laplacian_2, self.conv_order, x_1_to_2)
+        if self.sc_order == 2:
+            blocks_2 = ((x_2, (operator_2,)),
+                        (x_1_to_2, (operator_2,)))
         elif self.sc_order > 2:
-            x_1_to_2 = self.chebyshev_conv(laplacian_down_2, self.conv_order, x_1_to_2)
-
-        x_1_to_2 = torch.cat((x_1_to_2_identity, x_1_to_2), 2)
-
-        x_2_all = torch.cat((x_2_to_2, x_1_to_2), 2)
-
-        y_0 = torch.einsum('nik,iok->no', x_0_all, self.weight_0)
-        y_1 = torch.einsum('nik,iok->no', x_1_all, self.weight_1)
-        y_2 = torch.einsum('nik,iok->no', x_2_all, self.weight_2) 
+            blocks_2 = ((x_2, (operator_down_2, operator_up_2)),
+                        (x_1_to_2, (operator_down_2,)))
+
+        outputs = ((blocks_0, self.weight_0),
+                   (blocks_1, self.weight_1),
+                   (blocks_2, self.weight_2))
+        # the convolutions of the three outputs are independent, and are
+        # run concurrently by a single call of the scripted driver
+        chains_all = [self._chebyshev_chains(blocks, weight)
+                      for blocks, weight in outputs]
+        chains = [chain for chains_out in chains_all for chain in chains_out]
+        chain_convs = self._run_chebyshev_chains(chains)
+
+        xs_all, n_operators_all, convs_all = [], [], []
+        start = 0
+        for (blocks, weight), chains_out in zip(outputs, chains_all):
+            convs_all.append(self._gather_chebyshev_convs(
+                blocks, weight, chains_out,
+                chain_convs[start:start + len(chains_out)]))
+            start += len(chains_out)
+            xs_all.append([x for x, _ in blocks])
+            n_operators_all.append([len(ops) for _, ops in blocks])
+        weights = [weight for _, weight in outputs]
+
+        if self.compile_forward:
+            y_0, y_1, y_2 = (
+                self.block_conv(xs, n_operators, weight, convs)
+                for xs, n_operators, weight, convs in zip(
+                    xs_all, n_operators_all, weights, convs_all))
+        else:
+            # the contractions are independent as well, and the features
+            # are already in amp_dtype, which the scripted code keeps
+            y_0, y_1, y_2 = _fork_block_convs(
+                xs_all, n_operators_all, weights, convs_all, self.conv_order,
+                [self.use_weights_first(weight) for weight in weights])
     
         if self.update_func is None:
             return y_0, y_1, y_2
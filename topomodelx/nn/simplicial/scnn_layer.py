@@ -100,12 +100,12 @@ class SCNNLayer(torch.nn.Module):
         r""" aggregation normalization 
         """
         neighborhood_size = torch.sum(conv_operator.to_dense(), dim=1)
-        neighborhood_size_inv = 1/neighborhood_size
-        neighborhood_size_inv[~(torch.isfinite(neighborhood_size_inv))] = 0
-        
-        x = torch.einsum("i,ij->ij ", neighborhood_size_inv, x)
-        x[~torch.isfinite(x)] = 0
-        return x 
+        # masking the inverse up front rules out non-finite products, so x
+        # itself does not need to be scanned
+        neighborhood_size_inv = torch.where(
+            neighborhood_size != 0, neighborhood_size.reciprocal(),
+            torch.zeros_like(neighborhood_size))
+        return x * neighborhood_size_inv.unsqueeze(1)
       
     def update(self, x):
         """Update embeddings on each cell (step 4).
@@ -142,7 +142,8 @@ class SCNNLayer(torch.nn.Module):
           x[:,:,k] = (conv_operator@....@conv_operator) @ x 
         """
         num_simplices, num_channels = x.shape
-        X = torch.empty(size=(num_simplices, num_channels, conv_order))
+        X = torch.empty(size=(num_simplices, num_channels, conv_order),
+                        dtype=x.dtype, device=x.device)
         X[:, :, 0] = torch.mm(conv_operator, x)
         for k in range(1, conv_order):
             X[:, :, k] = torch.mm(conv_operator, X[:, :, k-1])
@@ -174,7 +175,7 @@ class SCNNLayer(torch.nn.Module):
 
         num_simplices, _ = x.shape 
 
-        identity = torch.eye(num_simplices)
+        identity = torch.eye(num_simplices, dtype=x.dtype, device=x.device)
 
         x_identity = torch.unsqueeze(identity@x, 2)
 